@@ -7,6 +7,10 @@
 # Fourier: f.fourier2d(u, lambdaTh, lambdaZ, r, th, z, rect)
 # Gauss:   f.gauss2d(u, lambdaTh, lambdaZ, r, th, z)
 # Box:     f.box2d(u, lambdaTh, lambdaZ, r, th, z)
+# Note that the FFTs are deliberately not zero-padded to a faster transform size (see
+# scipy.fft.next_fast_len), since the data is periodic in theta and z and padding would
+# alter the filtered field. For best FFT performance choose nth and nz with small prime
+# factors only (2, 3, 5, 7) when setting up the simulation grid.
 
 import sys
 import os.path
@@ -14,16 +18,69 @@ import timeit
 import math
 import numpy as np
 import multiprocessing
-from joblib import Parallel, delayed
+import scipy.fft
+from scipy.fft import rfft2, irfft2
 
+# number of threads used by every FFT; all planes of a 3d field are transformed in one
+# batched FFT call, so there is no outer parallel loop competing for the same cores
+nThreads = multiprocessing.cpu_count()
 
+# set to True to run the CPU transforms with FFTW (via pyFFTW, requires pyfftw) instead of
+# scipy's built-in pocketfft; the backend is only set around the FFT calls of this module,
+# scipy.fft stays untouched for the rest of the program; pocketfft is usually as fast
+fftw = False
 
-def fourier2dThZ(u, rPos, lambdaTh, lambdaZ, th, z, rect):
-    # 2d Fourier filter (aka sharp spectral cut-off) applied to a 2d data slice
-    # in a wall-parallel th-z-plane defined in a cylindrical co-ordinate frame
-    # work (r,th,z). Applied in Fourier space via FFT and convolution theorem.
+# set to True to filter 3d fields on a CUDA device using CuPy (requires cupy); the whole
+# field is copied to the GPU, all planes are filtered by one batched cuFFT and the result
+# is copied back, so the field plus its spectrum must fit into GPU memory
+gpu = False
+
+
+
+def fftwBackend():
+    # Set-up pyFFTW and return its scipy.fft backend for use with scipy.fft.set_backend().
+    # Plans are only estimated, measuring them costs much more than it gains for the few
+    # transforms of each shape done here.
+    import pyfftw
+    import pyfftw.interfaces.scipy_fft
+    pyfftw.config.PLANNER_EFFORT = 'FFTW_ESTIMATE'
+    pyfftw.config.NUM_THREADS = nThreads
+    return pyfftw.interfaces.scipy_fft
+
+
+
+def rfft2ThZ(u):
+    # Real-to-complex 2d FFT along the last two axes (th, z). Runs on the CPU
+    # for numpy arrays and on the GPU for cupy arrays.
+    if isinstance(u, np.ndarray):
+        if fftw:
+            with scipy.fft.set_backend(fftwBackend()):
+                return rfft2(u, axes=(-2,-1), workers=nThreads)
+        return rfft2(u, axes=(-2,-1), workers=nThreads)
+    import cupyx.scipy.fft
+    return cupyx.scipy.fft.rfft2(u, axes=(-2,-1))
+
+
+
+def irfft2ThZ(uHat, s):
+    # Complex-to-real inverse 2d FFT along the last two axes (th, z) returning
+    # data of shape s in (th, z). The input spectrum uHat may be destroyed.
+    # Runs on the CPU for numpy arrays and on the GPU for cupy arrays.
+    if isinstance(uHat, np.ndarray):
+        if fftw:
+            with scipy.fft.set_backend(fftwBackend()):
+                return irfft2(uHat, s=s, axes=(-2,-1), overwrite_x=True, workers=nThreads)
+        return irfft2(uHat, s=s, axes=(-2,-1), overwrite_x=True, workers=nThreads)
+    import cupyx.scipy.fft
+    return cupyx.scipy.fft.irfft2(uHat, s=s, axes=(-2,-1), overwrite_x=True)
+
+
+
+def fourier2dKernel(rPos, lambdaTh, lambdaZ, th, z, rect):
+    # 2d Fourier filter (aka sharp spectral cut-off) kernel in Fourier space for a
+    # wall-parallel th-z-plane defined in a cylindrical co-ordinate frame work
+    # (r,th,z). Constructed once and passed to fourier2dThZ().
     # Input parameters:
-    # u:         2d scalar field, e.g. one velocity component
     # rPos:      radial location (r) of wall-parallel data slice
     # lambdaTh:  filter width in theta direction, arc length in unit length
     # lambdaZ:   filter width in z direction in unit length
@@ -31,7 +88,11 @@ def fourier2dThZ(u, rPos, lambdaTh, lambdaZ, th, z, rect):
     # z:         1d axial (z) grid vector in unit length
     # rect:      switch for rectangular or elliptical (circular) kernel formulation
     # Output parameters:
-    # uFiltered: 2d scalar field, which is 2d-filtered in theta and z direction
+    # gTh:       1d azimuthal (th) step function in Fourier space, length nth, as
+    #            boolean mask of the retained wavenumbers
+    # gZ:        1d axial (z) step function in Fourier space, length nz//2+1, as
+    #            boolean mask of the retained wavenumbers, the 2d kernel in the
+    #            th-z-plane is the outer product of gTh and gZ
 
     # set-up sample spacing in unit length (pipe radius R)
     deltaTh = (th[1]-th[0])*rPos   # equidistant but r dependent
@@ -39,7 +100,7 @@ def fourier2dThZ(u, rPos, lambdaTh, lambdaZ, th, z, rect):
 
     # set-up wavenumber vector in unit cycle per length (1/R)
     kTh = np.fft.fftfreq(len(th), d=deltaTh)   # homogeneous azimuthal (th) direction
-    kZ  = np.fft.fftfreq(len(z),  d=deltaZ)    # homogeneous axial (z) direction
+    kZ  = np.fft.rfftfreq(len(z), d=deltaZ)    # homogeneous axial (z) direction, real input -> half spectrum
 
     # set-up wavenumber vector in unit radian per length (2pi/R)
     kappaTh = 2.0*np.pi*kTh   # homogeneous azimuthal (th) direction
@@ -49,27 +110,45 @@ def fourier2dThZ(u, rPos, lambdaTh, lambdaZ, th, z, rect):
     kappaThC = np.pi/lambdaTh   # azimuthal (th) direction
     kappaZC  = np.pi/lambdaZ    # axial (z) direction
 
-    # construct 2d filter kernel
+    # construct separable 2d filter kernel
     if rect == 1:
-     gTh = np.heaviside(kappaThC-abs(kappaTh), 1)   # 1d azimuthal (th) kernel, step function
-     gZ  = np.heaviside(kappaZC -abs(kappaZ),  1)   # 1d axial (z) kernel, step function
-     g2d = np.outer(gTh, gZ)                        # 2d (rectangular) kernel in th-z-plane
+     gTh = abs(kappaTh) <= kappaThC   # 1d azimuthal (th) kernel, step function as mask
+     gZ  = abs(kappaZ)  <= kappaZC    # 1d axial (z) kernel, step function as mask
     else:
      # please implement elliptical kernel here
      sys.exit('\nERROR: Set rect=1. Circular/elliptical kernel not implemented yet...')
 
-    # apply 2d Fourier filter kernel in Fourier space via FFT
-    uFiltered = np.fft.ifft2(np.fft.fft2(u) * g2d)
+    return gTh, gZ
+
+
+
+def fourier2dThZ(u, gTh, gZ):
+    # 2d Fourier filter (aka sharp spectral cut-off) applied to a 2d data slice
+    # in a wall-parallel th-z-plane defined in a cylindrical co-ordinate frame
+    # work (r,th,z). Applied in Fourier space via FFT and convolution theorem.
+    # Input parameters:
+    # u:         2d scalar field, e.g. one velocity component, or a stack of 2d
+    #            fields with (th, z) as the last two axes, numpy or cupy array
+    # gTh, gZ:   1d filter kernels (masks) as constructed by fourier2dKernel()
+    # Output parameters:
+    # uFiltered: 2d scalar field, which is 2d-filtered in theta and z direction
+
+    # apply 2d Fourier filter kernel in Fourier space via real-to-complex FFT (multi-threaded),
+    # the sharp cut-off simply zeros all modes outside the kernel, one direction at a time
+    uFiltered = rfft2ThZ(u)                                # float32 input gives complex64 spectrum
+    uFiltered[..., ~gTh, :] = 0.0                          # azimuthal (th) direction
+    uFiltered[..., ~gZ]     = 0.0                          # axial (z) direction
+    uFiltered = irfft2ThZ(uFiltered, u.shape[-2:])
  
-    return uFiltered.real
+    return uFiltered
 
 
 
-def fourier2d(u, lambdaTh, lambdaZ, r, th, z, rect=1):
+def fourier2d(u, lambdaTh, lambdaZ, r, th, z, rect=1, out=None):
     # 2d Fourier filter (aka sharp spectral cut-off) applied to a 3d data set
     # defined in a cylindrical co-ordinate frame work (r, th, z). Wrapper
-    # function, which simply calls the function fourier2dThZ() multiple times
-    # (in parallel) for every wall normal loaction (r).
+    # function, which filters all wall normal locations (r) at once using a
+    # batched 2d FFT, see fourier2dThZ() for the single-slice version.
     # Input parameters:
     # u:         2d scalar field, e.g. one velocity component
     # lambdaTh:  filter width in theta direction, arc length in unit length
@@ -78,41 +157,52 @@ def fourier2d(u, lambdaTh, lambdaZ, r, th, z, rect=1):
     # th:        1d azimuthal (th) grid vector in unit radian
     # z:         1d axial (z) grid vector in unit length
     # rect:      switch for rectangular or elliptical (circular) kernel formulation
+    # out:       optional 3d output array, e.g. a np.memmap on disk, which is filled
+    #            plane by plane to limit memory usage for fields larger than RAM
     # Output parameters:
     # uFiltered: 3d scalar field, which is 2d-filtered in theta and z direction
     #            for every radial location (r)
                 
-    # construct output array of correct shape filled with zeros
-    uFiltered = np.zeros((len(r), len(th), len(z)))
-    
-    # filter each wall-normal (theta-z) plane separately, this can be done in parallel
-    # uFiltered = np.array(Parallel(n_jobs=multiprocessing.cpu_count())(delayed(fourier2dThZ)(u[i,:,:], r[i], lambdaTh, lambdaZ, th, z, rect) for i in range(len(r))))
-    
     # uncomment for Härtel hack: constant angle instead of constant arc length
     rRef = 0.986 # radial reference location, where given arc length is converted to used filter angle
-    uFiltered = np.array(Parallel(n_jobs=multiprocessing.cpu_count())(delayed(fourier2dThZ)(u[i,:,:], rRef, lambdaTh, lambdaZ, th, z, rect) for i in range(len(r))))
+
+    # with the Härtel hack the kernel is the same for all wall-parallel planes, so it is
+    # constructed only once and all planes are filtered at once by one batched 2d FFT
+    gTh, gZ = fourier2dKernel(rRef, lambdaTh, lambdaZ, th, z, rect)
+    if out is not None:
+     for i in range(len(r)):
+      out[i] = fourier2dThZ(u[i,:,:], gTh, gZ) # one plane at a time, written directly to out
+     uFiltered = out
+    elif gpu:
+     import cupy
+     uFiltered = cupy.asnumpy(fourier2dThZ(cupy.asarray(u), cupy.asarray(gTh), cupy.asarray(gZ)))
+    else:
+     uFiltered = fourier2dThZ(u, gTh, gZ)
     
-    # simple serial version
+    # filter each wall-normal (theta-z) plane separately with its own r-dependent kernel,
+    # serial loop since the FFTs are multi-threaded already
+    # uFiltered = np.empty((len(r), len(th), len(z)), dtype=u.dtype)
     # for i in range(len(r)):
-    # uFiltered[i] = fourier2dThZ(u[i,:,:], r[i], lambdaTh, lambdaZ, th, z, rect)
+    # uFiltered[i] = fourier2dThZ(u[i,:,:], *fourier2dKernel(r[i], lambdaTh, lambdaZ, th, z, rect))
     
     return uFiltered
 
 
 
-def gauss2dThZ(u, rPos, lambdaTh, lambdaZ, th, z):
-    # 2d Gauss filter applied to a 2d data slice in a wall-parallel th-z-plane
-    # defined in a cylindrical co-ordinate frame work (r,th,z). Applied in
-    # Fourier space via FFT and convolution theorem.
+def gauss2dKernel(rPos, lambdaTh, lambdaZ, th, z):
+    # 2d Gauss filter kernel in Fourier space for a wall-parallel th-z-plane
+    # defined in a cylindrical co-ordinate frame work (r,th,z). Constructed
+    # once and passed to gauss2dThZ().
     # Input parameters:
-    # u:         2d scalar field, e.g. one velocity component
+    # rPos:      radial location (r) of wall-parallel data slice
     # lambdaTh:  filter width in theta direction, arc length in unit length
     # lambdaZ:   filter width in z direction in unit length
     # th:        1d azimuthal (th) grid vector in unit radian
     # z:         1d axial (z) grid vector in unit length
-    # rect:      switch for rectangular or elliptical (circular) kernel formulation
     # Output parameters:
-    # uFiltered: 2d scalar field, which is 2d-filtered in theta and z direction
+    # gTh:       1d azimuthal (th) kernel in Fourier space, length nth
+    # gZ:        1d axial (z) kernel in Fourier space, length nz//2+1, the 2d kernel
+    #            in the th-z-plane is the outer product of gTh and gZ
     
     # set-up sample spacing in unit length (pipe radii R, gap width d, etc)
     deltaTh = (th[1]-th[0])*rPos   # equidistant but r dependent
@@ -120,33 +210,54 @@ def gauss2dThZ(u, rPos, lambdaTh, lambdaZ, th, z):
     
     # set-up wavenumber vector in unit cycle per length (1/R)
     kTh = np.fft.fftfreq(len(th), d=deltaTh)   # homogeneous azimuthal (th) direction
-    kZ  = np.fft.fftfreq(len(z),  d=deltaZ)    # homogeneous axial (z) direction
+    kZ  = np.fft.rfftfreq(len(z), d=deltaZ)    # homogeneous axial (z) direction, real input -> half spectrum
     
     # set-up wavenumber vector in unit radian per length (2pi/R)
     kappaTh = 2.0*np.pi*kTh   # homogeneous azimuthal (th) direction
     kappaZ  = 2.0*np.pi*kZ    # homogeneous axial (z) direction
     
-    # construct 2d filter kernel in Fourier space
+    # construct 2d filter kernel in Fourier space, the Gaussian is separable, i.e.
+    # exp(-(a+b)) = exp(-a)*exp(-b), so only nth+nz instead of nth*nz exponentials
+    # are evaluated and the 2d kernel is never materialised
     gTh = np.exp((kappaTh*lambdaTh)**2.0/-24.0)   # 1d azimuthal (th) kernel, Gaussian
     gZ  = np.exp((kappaZ *lambdaZ )**2.0/-24.0)   # 1d axial (z) kernel, Gaussian
-    g2d = np.outer(gTh, gZ)                       # 2d kernel in th-z-plane
     
     # report kernel
     # if report == 1:
     # printKernel() please implement output in form of plot and ascii file
+
+    return gTh, gZ
+
+
+
+def gauss2dThZ(u, gTh, gZ):
+    # 2d Gauss filter applied to a 2d data slice in a wall-parallel th-z-plane
+    # defined in a cylindrical co-ordinate frame work (r,th,z). Applied in
+    # Fourier space via FFT and convolution theorem.
+    # Input parameters:
+    # u:         2d scalar field, e.g. one velocity component, or a stack of 2d
+    #            fields with (th, z) as the last two axes, numpy or cupy array
+    # gTh, gZ:   1d filter kernels as constructed by gauss2dKernel()
+    # Output parameters:
+    # uFiltered: 2d scalar field, which is 2d-filtered in theta and z direction
                 
-    # apply 2d Gauss filter kernel in Fourier space via FFT
-    uFiltered = np.fft.ifft2(np.fft.fft2(u)*g2d)
+    # apply 2d Gauss filter kernel in Fourier space via real-to-complex FFT
+    uFiltered = rfft2ThZ(u)                                # float32 input gives complex64 spectrum
+    dtype = uFiltered.real.dtype                           # apply kernel in precision of the data,
+                                                           # i.e. float32 kernel for float32 data
+    uFiltered *= gTh.astype(dtype, copy=False)[:, None]    # azimuthal (th) direction
+    uFiltered *= gZ.astype(dtype, copy=False)              # axial (z) direction
+    uFiltered = irfft2ThZ(uFiltered, u.shape[-2:])
     
-    return uFiltered.real
+    return uFiltered
 
 
 
-def gauss2d(u, lambdaTh, lambdaZ, r, th, z):
+def gauss2d(u, lambdaTh, lambdaZ, r, th, z, out=None):
     # 2d Gauss filter applied to a 3d data set defined in a cylindrical
-    # co-ordinate frame work (r, th, z). Wrapper function, which simply calls
-    # the function gauss2dThZ() multiple times (in parallel) for every wall
-    # normal loaction (r).
+    # co-ordinate frame work (r, th, z). Wrapper function, which filters all
+    # wall normal locations (r) at once using a batched 2d FFT, see
+    # gauss2dThZ() for the single-slice version.
     # Input parameters:
     # u:         2d scalar field, e.g. one velocity component
     # lambdaTh:  filter width in theta direction, arc length in unit length
@@ -154,42 +265,52 @@ def gauss2d(u, lambdaTh, lambdaZ, r, th, z):
     # r:         1d radial (r) grid vector in unit length
     # th:        1d azimuthal (th) grid vector in unit radian
     # z:         1d axial (z) grid vector in unit length
+    # out:       optional 3d output array, e.g. a np.memmap on disk, which is filled
+    #            plane by plane to limit memory usage for fields larger than RAM
     # Output parameters:
     # uFiltered: 3d scalar field, which is 2d-filtered in theta and z direction
     #            for every radial location (r)
 
-    # construct output array of correct shape filled with zeros
-    uFiltered = np.zeros((len(r), len(th), len(z)))
-
-    # filter each wall-normal (theta-z) plane separately, this can be done in parallel
-    #uFiltered=np.array(Parallel(n_jobs=multiprocessing.cpu_count())(delayed(gauss2dThZ)(u[i,:,:],r[i],lambdaTh, lambdaZ, th ,z) for i in range(len(r))))
-
     # uncomment for Härtel hack: constant angle instead of constant arc length
     rRef = 0.986 # radial reference location where given arc length is converted to used filter angle
-    uFiltered = np.array(Parallel(n_jobs=multiprocessing.cpu_count())(delayed(gauss2dThZ)(u[i,:,:], rRef, lambdaTh, lambdaZ, th, z) for i in range(len(r))))
 
-    # simple serial version
+    # with the Härtel hack the kernel is the same for all wall-parallel planes, so it is
+    # constructed only once and all planes are filtered at once by one batched 2d FFT
+    gTh, gZ = gauss2dKernel(rRef, lambdaTh, lambdaZ, th, z)
+    if out is not None:
+     for i in range(len(r)):
+      out[i] = gauss2dThZ(u[i,:,:], gTh, gZ) # one plane at a time, written directly to out
+     uFiltered = out
+    elif gpu:
+     import cupy
+     uFiltered = cupy.asnumpy(gauss2dThZ(cupy.asarray(u), cupy.asarray(gTh), cupy.asarray(gZ)))
+    else:
+     uFiltered = gauss2dThZ(u, gTh, gZ)
+
+    # filter each wall-normal (theta-z) plane separately with its own r-dependent kernel,
+    # serial loop since the FFTs are multi-threaded already
+    # uFiltered = np.empty((len(r), len(th), len(z)), dtype=u.dtype)
     # for i in range(len(r)):
-    #uFiltered[i] = gauss2dThZ(u[i,:,:], r[i], lambdaTh, lambdaZ, th, z)
+    #uFiltered[i] = gauss2dThZ(u[i,:,:], *gauss2dKernel(r[i], lambdaTh, lambdaZ, th, z))
 
     return uFiltered
 
 
 
-def box2dThZ(u, rPos, lambdaTh, lambdaZ, th, z):
-    # 2d box (or top hat) filter applied to a 2d data slice in a wall-parallel
+def box2dKernel(rPos, lambdaTh, lambdaZ, th, z):
+    # 2d box (or top hat) filter kernel in Fourier space for a wall-parallel
     # th-z-plane defined in a cylindrical co-ordinate frame work (r,th,z).
-    # Applied in Fourier space via FFT and convolution theorem.
+    # Constructed once and passed to box2dThZ().
     # Input parameters:
-    # u:         2d scalar field, e.g. one velocity component
     # rPos:      radial location (r) of wall-parallel data slice
     # lambdaTh:  filter width in theta direction, arc length in unit length
     # lambdaZ:   filter width in z direction in unit length
     # th:        1d azimuthal (th) grid vector in unit radian
     # z:         1d axial (z) grid vector in unit length
-    # rect:      switch for rectangular or elliptical kernel formulation
     # Output parameters:
-    # uFiltered: 2d scalar field, which is 2d-filtered in theta and z direction
+    # gTh:       1d azimuthal (th) kernel in Fourier space, length nth
+    # gZ:        1d axial (z) kernel in Fourier space, length nz//2+1, the 2d kernel
+    #            in the th-z-plane is the outer product of gTh and gZ
 
     # set-up sample spacing in unit length (pipe radius R)
     deltaTh = (th[1]-th[0])*rPos   # equidistant but r dependent
@@ -197,31 +318,46 @@ def box2dThZ(u, rPos, lambdaTh, lambdaZ, th, z):
     
     # set-up wavenumber vector in unit cycle per length (1/R)
     kTh = np.fft.fftfreq(len(th), d=deltaTh)   # homogeneous azimuthal (th) direction
-    kZ  = np.fft.fftfreq(len(z),  d=deltaZ)    # homogeneous axial (z) direction
-    
-    # set-up wavenumber vector in unit radian per length (2pi/R)
-    kappaTh = 2.0*np.pi*kTh   # homogeneous azimuthal (th) direction
-    kappaZ  = 2.0*np.pi*kZ    # homogeneous axial (z) direction
+    kZ  = np.fft.rfftfreq(len(z), d=deltaZ)    # homogeneous axial (z) direction, real input -> half spectrum
     
     # construct 2d filter kernel in Fourier space
     gTh = np.sinc(kTh*lambdaTh)   # 1d azimuthal (th) kernel, Box -> sinc
     gZ  = np.sinc(kZ *lambdaZ)    # 1d axial (z) kernel, Box -> sinc
-    g2d = np.outer(gTh, gZ)       # 2d filter kernel in theta-z plane
                                   # Note that sine cardinal is implemented in normalised form in numpy
                                   # see https://numpy.org/devdocs/reference/generated/numpy.sinc.html
 
-    # apply 2d filter kernel in Fourier space via FFT
-    uFiltered = np.fft.ifft2(np.fft.fft2(u)*g2d)
+    return gTh, gZ
 
-    return uFiltered.real
 
 
+def box2dThZ(u, gTh, gZ):
+    # 2d box (or top hat) filter applied to a 2d data slice in a wall-parallel
+    # th-z-plane defined in a cylindrical co-ordinate frame work (r,th,z).
+    # Applied in Fourier space via FFT and convolution theorem.
+    # Input parameters:
+    # u:         2d scalar field, e.g. one velocity component, or a stack of 2d
+    #            fields with (th, z) as the last two axes, numpy or cupy array
+    # gTh, gZ:   1d filter kernels as constructed by box2dKernel()
+    # Output parameters:
+    # uFiltered: 2d scalar field, which is 2d-filtered in theta and z direction
 
-def box2d(u, lambdaTh, lambdaZ, r, th, z):
+    # apply 2d filter kernel in Fourier space via real-to-complex FFT
+    uFiltered = rfft2ThZ(u)                                # float32 input gives complex64 spectrum
+    dtype = uFiltered.real.dtype                           # apply kernel in precision of the data,
+                                                           # i.e. float32 kernel for float32 data
+    uFiltered *= gTh.astype(dtype, copy=False)[:, None]    # azimuthal (th) direction
+    uFiltered *= gZ.astype(dtype, copy=False)              # axial (z) direction
+    uFiltered = irfft2ThZ(uFiltered, u.shape[-2:])
+
+    return uFiltered
+
+
+
+def box2d(u, lambdaTh, lambdaZ, r, th, z, out=None):
     # 2d Box filter applied to a 3d data set defined in a cylindrical
-    # co-ordinate frame work (r, th, z). Wrapper function, which simply calls
-    # the function box2dThZ() multiple times (in parallel) for every wall normal
-    # loaction (r).
+    # co-ordinate frame work (r, th, z). Wrapper function, which filters all
+    # wall normal locations (r) at once using a batched 2d FFT, see box2dThZ()
+    # for the single-slice version.
     # Input parameters:
     # u:         2d scalar field, e.g. one velocity component
     # lambdaTh:  filter width in theta direction, arc length in unit length
@@ -229,22 +365,32 @@ def box2d(u, lambdaTh, lambdaZ, r, th, z):
     # r:         1d radial (r) grid vector in unit length
     # th:        1d azimuthal (th) grid vector in unit radian
     # z:         1d axial (z) grid vector in unit length
+    # out:       optional 3d output array, e.g. a np.memmap on disk, which is filled
+    #            plane by plane to limit memory usage for fields larger than RAM
     # Output parameters:
     # uFiltered: 3d scalar field, which is 2d-filtered in theta and z direction
     #            for every radial location (r)
 
-    # construct output array of correct shape filled with zeros
-    uFiltered = np.zeros((len(r), len(th), len(z)))
-
-    # filter each wall-normal (theta-z) plane separately, this can be done in parallel
-    #uFiltered=np.array(Parallel(n_jobs=multiprocessing.cpu_count())(delayed(box2dThZ)(u[i,:,:],r[i], lambdaTh, lambdaZ, th ,z) for i in range(len(r))))
-
     # uncomment for Härtel hack: constant angle instead of constant arc length
     rRef = 0.986 # radial reference location where given arc length is converted to used filter angle
-    uFiltered = np.array(Parallel(n_jobs=multiprocessing.cpu_count())(delayed(box2dThZ)(u[i,:,:], rRef, lambdaTh, lambdaZ, th, z) for i in range(len(r))))
 
-    # simple serial version
+    # with the Härtel hack the kernel is the same for all wall-parallel planes, so it is
+    # constructed only once and all planes are filtered at once by one batched 2d FFT
+    gTh, gZ = box2dKernel(rRef, lambdaTh, lambdaZ, th, z)
+    if out is not None:
+     for i in range(len(r)):
+      out[i] = box2dThZ(u[i,:,:], gTh, gZ) # one plane at a time, written directly to out
+     uFiltered = out
+    elif gpu:
+     import cupy
+     uFiltered = cupy.asnumpy(box2dThZ(cupy.asarray(u), cupy.asarray(gTh), cupy.asarray(gZ)))
+    else:
+     uFiltered = box2dThZ(u, gTh, gZ)
+
+    # filter each wall-normal (theta-z) plane separately with its own r-dependent kernel,
+    # serial loop since the FFTs are multi-threaded already
+    # uFiltered = np.empty((len(r), len(th), len(z)), dtype=u.dtype)
     # for i in range(len(r)):
-    # uFiltered[i] = box2dThZ(u[i,:,:], r[i], lambdaTh, lambdaZ, th, z)
+    # uFiltered[i] = box2dThZ(u[i,:,:], *box2dKernel(r[i], lambdaTh, lambdaZ, th, z))
 
     return uFiltered
@@ -15,9 +15,24 @@
 # Modified: 24th September 2019
 
 import timeit
+import os.path
 import numpy as np
 import h5py
 
+def loadtxtCached(fnam, usecols):
+    # read columns from ascii file like np.loadtxt(fnam, usecols=usecols, unpack=True), but
+    # keep a binary copy (.npy) next to the ascii file, which is read instead on subsequent
+    # runs to skip parsing; the binary copy is rebuilt when the ascii file is newer
+    fnpy = fnam+'.col'+'-'.join(str(i) for i in np.atleast_1d(usecols))+'.npy'
+    if os.path.isfile(fnpy) and os.path.getmtime(fnpy) >= os.path.getmtime(fnam):
+        return np.load(fnpy)
+    data = np.loadtxt(fnam, usecols=usecols, unpack=True)
+    try:
+        np.save(fnpy, data)
+    except OSError:
+        pass # e.g. read-only data directory, the binary copy is optional
+    return data
+
 # plot mode: (0) none, (1) interactive, (2) pdf
 print('Plot 1d and 2d cross-correlations between energy flux and Q3 (inward) interactions based on different kernels.')
 plot = int(input("Enter plot mode (0 = none, 1 = interactive, 2 = pdf file): "))
@@ -29,34 +44,34 @@ Re_tau =  180.4 # Shear Reynolds number Re_tau = u_tau * R / nu
 # read 1d azimuthal cross-correlation with Q3 events for Fourier filtered eFlux from ascii file
 fnam = 'piCorrThQsFourier2d_pipe0002_00570000to01675000nt0222.dat'
 print('Reading 1d cross-correlation from', fnam)
-th1d  = np.loadtxt(fnam)[:, 0] # 1st column: Azimuthal separation, only once
-pqthF = np.loadtxt(fnam)[:, 8] # 9th column: Cross-correlation Q3 with Pi
+th1d, pqthF = loadtxtCached(fnam, (0, 8)) # 1st column: Azimuthal separation, only once
+                                          # 9th column: Cross-correlation Q3 with Pi
 
 # read 1d azimuthal cross-correlation with Q3 events for Gauss filtered eFlux from ascii file
 fnam = 'piCorrThQsGauss2d_pipe0002_00570000to01675000nt0222.dat'
 print('Reading 1d cross-correlation from', fnam)
-pqthG = np.loadtxt(fnam)[:, 8] # 9th column: Cross-correlation Q3 with Pi
+pqthG = loadtxtCached(fnam, 8) # 9th column: Cross-correlation Q3 with Pi
 
 # read 1d azimuthal cross-correlation with Q3 events for box filtered eFlux from ascii file
 fnam = 'piCorrThQsBox2d_pipe0002_00570000to01675000nt0222.dat'
 print('Reading 1d cross-correlation from', fnam)
-pqthB = np.loadtxt(fnam)[:, 8] # 9th column: Cross-correlation Q3 with Pi
+pqthB = loadtxtCached(fnam, 8) # 9th column: Cross-correlation Q3 with Pi
 
 # read 1d axial cross-correlation with Q3 events for Fourier filtered eFlux from ascii file
 fnam = 'piCorrZQsFourier2d_pipe0002_00570000to01675000nt0222.dat'
 print('Reading 1d cross-correlation from', fnam)
-z1d  = np.loadtxt(fnam)[:, 0] # 1st column: Axial separation, only once
-pqzF = np.loadtxt(fnam)[:, 8] # 9th column: Cross-correlation Q3 with Pi
+z1d, pqzF = loadtxtCached(fnam, (0, 8)) # 1st column: Axial separation, only once
+                                        # 9th column: Cross-correlation Q3 with Pi
 
 # read 1d axial cross-correlation with Q3 events for Gauss filtered eFlux from ascii file
 fnam = 'piCorrZQsGauss2d_pipe0002_00570000to01675000nt0222.dat'
 print('Reading 1d cross-correlation from', fnam)
-pqzG = np.loadtxt(fnam)[:, 8] # 9th column: Cross-correlation Q3 with Pi
+pqzG = loadtxtCached(fnam, 8) # 9th column: Cross-correlation Q3 with Pi
 
 # read 1d axial cross-correlation with Q3 events for box filtered eFlux from ascii file
 fnam = 'piCorrZQsBox2d_pipe0002_00570000to01675000nt0222.dat'
 print('Reading 1d cross-correlation from', fnam)
-pqzB = np.loadtxt(fnam)[:, 8] # 9th column: Cross-correlation Q3 with Pi
+pqzB = loadtxtCached(fnam, 8) # 9th column: Cross-correlation Q3 with Pi
 
 # grid size, manual hack (TODO: read this from header info of piCorrThZ*.dat)
 nth = len(th1d) # 385  # azimuthal grid points
@@ -69,37 +84,30 @@ print('It is your responsibility to make sure that the 2d correlations are defin
 fnam = 'piCorrThZQsFourier2d_pipe0002_01675000to01675000nt0001.dat'
 fnam = 'piCorrThZQsFourier2d_pipe0002_00570000to01675000nt0222.dat'
 print('Reading 2d cross-correlations from', fnam)
-Dt = np.loadtxt(fnam)[:, 0] #  1st column: Azimuthal displacement
-Dz = np.loadtxt(fnam)[:, 1] #  2nd column: Axial displacement
-f  = np.loadtxt(fnam)[:, 9] # 10th column: Cross-correlation for Q3 and Pi
+Dt, Dz, f = loadtxtCached(fnam, (0, 1, 9)) #  1st column: Azimuthal displacement
+                                           #  2nd column: Axial displacement
+                                           # 10th column: Cross-correlation for Q3 and Pi
 
 # read 2d cross-correlation with Q3 events for Gauss filtered eFlux from ascii file
 fnam = 'piCorrThZQsGauss2d_pipe0002_01675000to01675000nt0001.dat'
 fnam = 'piCorrThZQsGauss2d_pipe0002_00570000to01675000nt0222.dat'
 print('Reading 2d cross-correlations from', fnam)
-g  = np.loadtxt(fnam)[:, 9] # 10th column: Cross-correlation for Q3 and Pi
+g  = loadtxtCached(fnam, 9) # 10th column: Cross-correlation for Q3 and Pi
 
 # read 2d cross-correlation with Q3 events for box filtered eFlux from ascii file
 fnam = 'piCorrThZQsBox2d_pipe0002_01675000to01675000nt0001.dat'
 fnam = 'piCorrThZQsBox2d_pipe0002_00570000to01675000nt0222.dat'
 print('Reading 2d cross-correlations from', fnam)
-b  = np.loadtxt(fnam)[:, 9] # 10th column: Cross-correlation for Q3 and Pi
+b  = loadtxtCached(fnam, 9) # 10th column: Cross-correlation for Q3 and Pi
 
-# re-cast cross-correlation data into 2d array for plotting
-# (TODO: this is straight-forward fortran programming style and can maybe be done much more efficiently in Python...?)
+# re-cast cross-correlation data into 2d array for plotting, data is stored row by row
+# with z running fastest, so a reshape (no copy) gives the 2d maps directly
 print('Re-cast data into 2d arrays for plotting')
-DeltaTh = np.zeros(nth)
-DeltaZ  = np.zeros(nz)
-ccF = np.zeros((nth, nz))
-ccG = np.zeros((nth, nz))
-ccB = np.zeros((nth, nz))
-for i in range(nth):
- for j in range(nz):
-  DeltaTh[i] = Dt[i*(nz)+j]
-  DeltaZ[j]  = Dz[i*(nz)+j]
-  ccF[i, j] = f[i*(nz)+j]
-  ccG[i, j] = g[i*(nz)+j]
-  ccB[i, j] = b[i*(nz)+j]
+DeltaTh = Dt.reshape(nth, nz)[:, 0] # azimuthal separation along 1st axis
+DeltaZ  = Dz.reshape(nth, nz)[0, :] # axial separation along 2nd axis
+ccF = f.reshape(nth, nz)
+ccG = g.reshape(nth, nz)
+ccB = b.reshape(nth, nz)
 
 # find absolute maxima of 2d data sets
 amccF = np.max(np.abs(ccF))            # Fourier max
@@ -6,10 +6,24 @@ import numpy as np
 import h5py
 #===================================================================================
 # Define energy flux (pi = t_ij * S_ij)
-def eflux(u1, u2, u3, u11, u12, u13, u22, u23, u33, r, th, z):
+def eflux(u1, u2, u3, u11, u12, u13, u22, u23, u33, r, th, z, rIndices=None):
 #------------------------------------------------------------
     # indices: indicates  co-ordinate direction: 1=r, 2=theta, 3=z
+    # rIndices: optional list of wall-normal planes, returns pi only for these planes
+    #           with shape (len(rIndices), nth, nz), default None returns pi for all r
 
+    if rIndices is not None:
+        # each plane needs only its direct radial neighbours for the radial derivatives,
+        # so compute pi on a sub-grid of (at most) three planes around each requested one
+        pi = np.empty((len(rIndices),) + u1.shape[1:], dtype=u1.dtype)
+        for n, i in enumerate(rIndices):
+            i  = i % len(r) # negative indices count from the outer wall, e.g. -1
+            lo = max(i-1, 0)
+            s  = slice(lo, min(i+2, len(r)))
+            pi[n] = eflux(u1[s], u2[s], u3[s], u11[s], u12[s], u13[s], u22[s], u23[s], u33[s], r[s], th, z)[i-lo]
+        return pi
+
+    r   = r.astype(u1.dtype, copy=False) # compute in precision of the data (fp32 or fp64)
     pi  = np.zeros((u1.shape)) # constructing an array of dimension(r) filled with zeros 
     r3d = np.tile(r, (len(z), len(th), 1)).T # Changing a 1D array to a 3D array as we have to divide u(:,:,:) by r. 
                                              # In python we have to reshape our array to 3D to perform the division.
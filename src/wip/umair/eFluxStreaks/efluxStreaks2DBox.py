@@ -21,7 +21,8 @@ import timeit
 import math
 import numpy as np
 import h5py
-from mpl_toolkits.axes_grid1 import make_axes_locatable
+import filters as f # filter functions
+import eflux        # energy flux function
 
 #--------------------------------------------------
 # range of state files to read from flow field data
@@ -37,11 +38,11 @@ print('=========================================================================
 # read grid from first hdf5 file
 fnam = '../outFiles/fields_pipe0002_'+'{:08d}'.format(iFirst)+'.h5'
 print('Reading grid from', fnam, 'with:')
-f  = h5py.File(fnam, 'r') # open hdf5 file for read only
-r  = np.array(f['grid/r'])
-z  = np.array(f['grid/z'])
-th = np.array(f['grid/th'])
-f.close() # close hdf5 file
+hf = h5py.File(fnam, 'r') # open hdf5 file for read only
+r  = np.array(hf['grid/r'])
+z  = np.array(hf['grid/z'])
+th = np.array(hf['grid/th'])
+hf.close() # close hdf5 file
 
 #------------------------------
 # grid size
@@ -57,8 +58,13 @@ print(nz, 'axial (z) points')
 fnam = '../statistics00570000to01005000nt0088.dat'
 print('-----------------------------------------------------------------')
 print('Reading mean velocity profiles from', fnam)
-u_zM = np.loadtxt(fnam)[:, 3]
-u_zR = np.loadtxt(fnam)[:, 7]
+u_zM, u_zR = np.loadtxt(fnam, usecols=(3, 7), unpack=True) # 4th and 8th column, read file only once
+
+#--------------------------------------------------
+# floating point precision of the whole filter and energy flux pipeline
+dtype = np.float32 # single precision is sufficient here and halves memory traffic
+#dtype = np.float64 # double precision
+u_zM = u_zM.astype(dtype)
 #--------------------------------------------------
 print('=============================================================================================')
 # define filter width for each direction seperately
@@ -77,44 +83,63 @@ print('Filter width in z:  lambdaZ+  =', '{:6.1f}'.format(lambdaZp),  'viscous u
 # parallel stuff
 import multiprocessing
 from joblib import Parallel, delayed
+from concurrent.futures import ThreadPoolExecutor
+# number of snapshots processed in parallel, the cores are shared among them for the batched
+# FFTs and each one needs memory for 28 fields of size nr*nth*nz at peak (stack of 9 fields,
+# its half spectrum of approx. 9 fields, 9 filtered fields and the read buffer), that is
+# approx. 6.5 GB in fp32 (13 GB in fp64) for 65x385x2305 points; the serial run (nJobs = 1)
+# needs 10 fields (approx. 2.3 GB in fp32) more for the prefetch buffers
+nJobs    = 1 # serial, the batched FFT already runs on all cores
+nWorkers = max(1, multiprocessing.cpu_count()//nJobs) # FFT threads per snapshot
 print('=============================================================================================')
-print("Running on", multiprocessing.cpu_count(), "cores")
+print("Running on", multiprocessing.cpu_count(), "cores,", nJobs, "snapshot(s) at a time with", nWorkers, "FFT threads each")
 print('=============================================================================================')
 
-# reset wall-clock time
-t0 = timeit.default_timer()
+#------------------------------------------------
+# read a 3d field stored as u[r,z,th] in the hdf5 file (openpipeflow, nsCouette/nsPipe)
+# directly into the scratch buffer uRaw and store it contiguously as u[r,th,z] in buf,
+# since the filter functions were made for u[r,th,z]
+def readField(hf, name, buf, uRaw):
+    hf[name].read_direct(uRaw)
+    np.copyto(buf, uRaw.transpose(0,2,1))
+    return buf
 
-# statistics loop over all state files
-for iFile in iFiles:
-    #-------------------------------------------------------------------------------
-    # read flow field data from next hdf5 file
+# wall-normal plane to extract, y+ approx 15
+k = 63
+
+#------------------------------------------------
+# read velocity field of one snapshot into the first three fields of the work stack uStack
+def readSnapshot(iFile, uRaw, uStack):
     fnam = '../outFiles/fields_pipe0002_'+'{:08d}'.format(iFile)+'.h5'
-    f = h5py.File(fnam, 'r')
-    print("Reading velocity field from file", fnam, end='', flush=True)
-    u_r  = np.array(f['fields/velocity/u_r']).transpose(0,2,1)  # do moidify transpose command to match data structures
-    u_th = np.array(f['fields/velocity/u_th']).transpose(0,2,1) # openpipeflow u[r,th,z] and nsCouette/nsPipe u[r,th,z]
-    u_z  = np.array(f['fields/velocity/u_z']).transpose(0,2,1)  # filter functions were made for u[r,th,z]
-    p    = np.array(f['fields/pressure']).transpose(0,2,1)      # filter functions were made for u[r,th,z]
-    f.close()
-    print(' with data structure u', u_z.shape)
+    hf = h5py.File(fnam, 'r')
+    readField(hf, 'fields/velocity/u_r',  uStack[0], uRaw)
+    readField(hf, 'fields/velocity/u_th', uStack[1], uRaw)
+    readField(hf, 'fields/velocity/u_z',  uStack[2], uRaw)
+    hf.close()
+    return uStack
+
+#------------------------------------------------
+# filter and compute energy flux for snapshot iFile already read into uStack,
+# returns 2d slices at r[k]
+def computeSnapshot(iFile, uStack):
+    u_r, u_th, u_z = uStack[0], uStack[1], uStack[2] # views, fields are read directly into the stack
+    print('-------------------------------------------------------------------------')
+    print("Processing velocity field of snapshot", iFile, 'with data structure u', u_z.shape)
     #-------------------------------------------------------------------------------
     # subtract mean velocity profiles (1d) from flow field (3d)
-    u_z  = u_z - np.tile(u_zM, (len(z), len(th), 1)).T
+    np.subtract(u_z, u_zM[:, None, None], out=u_z) # broadcast profile u_zM(r) over (th, z), in place to keep u_z in the stack
     #-------------------------------------------------------------------------------
     # filter velocity field, single components and mixed terms
     print('-------------------------------------------------------------------------')
     print('Filtering velocities... ', end='', flush=True)
     t1 = timeit.default_timer()
-    import filters as f
-    u_rF    = f.box2d(u_r,       lambdaTh, lambdaZ, r, th, z)
-    u_thF   = f.box2d(u_th,      lambdaTh, lambdaZ, r, th, z)
-    u_zF    = f.box2d(u_z,       lambdaTh, lambdaZ, r, th, z)
-    u_rRF   = f.box2d(u_r*u_r,   lambdaTh, lambdaZ, r, th, z)
-    u_rThF  = f.box2d(u_r*u_th,  lambdaTh, lambdaZ, r, th, z)
-    u_rZF   = f.box2d(u_r*u_z,   lambdaTh, lambdaZ, r, th, z)
-    u_thThF = f.box2d(u_th*u_th, lambdaTh, lambdaZ, r, th, z)
-    u_thZF  = f.box2d(u_th*u_z,  lambdaTh, lambdaZ, r, th, z)
-    u_zZF   = f.box2d(u_z*u_z,   lambdaTh, lambdaZ, r, th, z)
+    np.multiply(u_r,  u_r,  out=uStack[3]) # mixed terms into the pre-allocated stack,
+    np.multiply(u_r,  u_th, out=uStack[4]) # no temporary 3d arrays
+    np.multiply(u_r,  u_z,  out=uStack[5])
+    np.multiply(u_th, u_th, out=uStack[6])
+    np.multiply(u_th, u_z,  out=uStack[7])
+    np.multiply(u_z,  u_z,  out=uStack[8])
+    u_rF, u_thF, u_zF, u_rRF, u_rThF, u_rZF, u_thThF, u_thZF, u_zZF = f.box2dMulti(uStack, lambdaTh, lambdaZ, r, th, z, workers=nWorkers)
     print('Time elapsed:', '{:3.1f}'.format(timeit.default_timer()-t1), 'seconds')
     #-------------------------------------------------------------------------------    
 
@@ -122,120 +147,152 @@ for iFile in iFiles:
     t2 = timeit.default_timer()
     print('-------------------------------------------------------------------------')
     print('Computing energy flux... ', end='', flush=True)
-    import eflux as p
-    pi = p.eflux(u_rF, u_thF, u_zF, u_rRF, u_rThF, u_rZF, u_thThF, u_thZF, u_zZF, r, th, z)
+    pi = eflux.eflux(u_rF, u_thF, u_zF, u_rRF, u_rThF, u_rZF, u_thThF, u_thZF, u_zZF, r, th, z, rIndices=[k]) # only plane k
     #-------------------------------------------------------------------------------
     print('Time elapsed:', '{:3.1f}'.format(timeit.default_timer()-t2), 'seconds')
     #-------------------------------------------------------------------------------
-    print('-------------------------------------------------------------------------')
-    print('extracting eFlux from... ')
-    print('-------------------------------------------------------------------------')
-    t3 = timeit.default_timer()
-    k = 63
-    print ("Wall-normal plane at y+ =", (1-r[k])*180.4)
-    eFy15 = pi [k, :, :]  # extract 2d filtered eflux 
-    uZy15 = u_z[k, :, :]
+    # return 2d slices, copy of u_z so that the 3d work arrays can be released
+    return pi[0, :, :], u_z[k, :, :].copy()
+
+#------------------------------------------------
+# process one snapshot: read, filter and compute energy flux, returns 2d slices at r[k]
+def processSnapshot(iFile):
+    uRaw   = np.empty((nr, nz, nth), dtype=dtype)    # scratch buffer with data structure as in file, cast on read
+    uStack = np.empty((9, nr, nth, nz), dtype=dtype) # velocities and all mixed terms, filtered in one go
+    return computeSnapshot(iFile, readSnapshot(iFile, uRaw, uStack))
+
+# reset wall-clock time
+t0 = timeit.default_timer()
+
+# statistics loop over all state files
+if nJobs == 1:
+    # serial, allocate two pairs of read and work buffers only once and re-use them for all
+    # snapshots; while one snapshot is filtered, a single prefetch thread reads the next one
+    # into the other pair, the FFTs and numpy operations of the main thread release the GIL
+    buffers = [(np.empty((nr, nz, nth), dtype=dtype), np.empty((9, nr, nth, nz), dtype=dtype)) for i in range(2)]
+    results = []
+    with ThreadPoolExecutor(max_workers=1) as prefetch:
+        future = prefetch.submit(readSnapshot, iFiles[0], *buffers[0])
+        for i in range(len(iFiles)):
+            uStack = future.result() # wait for snapshot i
+            if i+1 < len(iFiles):
+                future = prefetch.submit(readSnapshot, iFiles[i+1], *buffers[(i+1)%2])
+            results.append(computeSnapshot(iFiles[i], uStack))
+else:
+    # snapshots are independent and processed in nJobs parallel processes, one snapshot per
+    # task since each task (read, filter, flux) is long compared to the overhead
+    results = Parallel(n_jobs=nJobs, backend='loky', batch_size=1)(delayed(processSnapshot)(iFile) for iFile in iFiles)
 
+#-------------------------------------------------------------------------------
+print('-------------------------------------------------------------------------')
+print('extracting eFlux from... ')
+print('-------------------------------------------------------------------------')
+print ("Wall-normal plane at y+ =", (1-r[k])*180.4)
+eFy15, uZy15 = results[-1] # 2d filtered eflux and u_z of last snapshot
 
 print('-------------------------------------------------------------------------')
 print('Total elapsed wall-clock time:', '{:3.1f}'.format(timeit.default_timer()-t0), 'seconds')
-#=============================================================================================
-print('-------------------------------------------------------------------------')
-print('Plotting cross-correlation to file')
 
 #=================================================================================
-# plot data as graph, (0) none, (1) interactive, (2) pdf
-plot = 2
-if plot not in [1, 2]: sys.exit() # skip everything below
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-
-
-mpl.rcParams['text.usetex'] = True
-mpl.rcParams['text.latex.preamble'] = [
-r"\usepackage[utf8x]{inputenc}",
-r"\usepackage[T1]{fontenc}",
-r"\usepackage[detect-all]{siunitx}",
-r'\usepackage{amsmath, amstext, amssymb}',
-r'\usepackage{xfrac}',
-r'\usepackage{lmodern, palatino, eulervm}']
-mpl.rcParams['font.family'] = 'serif'
-mpl.rcParams.update({'font.size': 9})
-
-# create figure suitable for A4 format
-def mm2inch(*tupl):
- inch = 25.4
- if isinstance(tupl[0], tuple):
-  return tuple(i/inch for i in tupl[0])
- else:
-   return tuple(i/inch for i in tupl)
-fig = plt.figure(num=None, figsize=mm2inch(160.0, 140.0), dpi=150)
-
-# line colours appropriate for colour-blind
-Vermillion    = '#D55E00'
-Blue          = '#0072B2'
-BluishGreen   = '#009E73'
-Orange        = '#E69F00'
-SkyBlue       = '#56B4E9'
-ReddishPurple = '#CC79A7'
-Yellow        = '#F0E442'
-Black         = '#000000'
-#-----------------------------------------------------------------------------------
-
-eFy15am  = np.max(np.abs(eFy15 ))
-uZy15am  = np.max(np.abs(uZy15 ))
-
-
-ncl = 50 # number of countur levels, increase to make plot smoother but larger
-comap = 'RdGy'
-#comap = 'PiYG'
-# plot 
-
-
-ax1 = plt.subplot2grid((2, 1), (0, 0), rowspan=1, colspan=1)
-#ax1.set_xlabel(r"${\Delta z}$ in $d$")
-ax1.set_ylabel(r"${r\Delta\theta}$ in $d$")
-cl1 = np.linspace(-eFy15am, +eFy15am, 5) # set contour levels manually
-#cf1 = ax1.contour(th*r[k], z, np.array(eFy15).transpose(1,0), cl1,  cmap='bwr', linestyles='dashed', linewidths=0.5) # , extend='both')
-cl2 = np.linspace(-uZy15am, +uZy15am, ncl) # set contour levels manually
-cf2 = ax1.contourf(z, th*r[k], uZy15, cl2,  cmap=comap)
-#ax1.set_aspect('equal') # makes axis ratio natural
-dvr = make_axes_locatable(ax1) # devider
-cbx = dvr.append_axes("bottom", size="5%", pad=0.3) # make colorbar axis
-cb1 = plt.colorbar(cf2, cax=cbx, ticks=[-uZy15am, 0, +uZy15am], orientation='horizontal') # set colorbar scale
-cbx.xaxis.set_ticks_position("bottom")
-
-
-ax2 = plt.subplot2grid((2, 1), (1, 0), rowspan=1, colspan=1)
-ax2.set_xlabel(r"${\Delta z}$ in $d$")
-ax2.set_ylabel(r"${r\Delta\theta}$ in $d$")
-#cl1 = np.linspace(-eFy15am, +eFy15am, 5) # set contour levels manually
-cl1 = [-eFy15am*0.7,-eFy15am*0.6,-eFy15am*0.5,-eFy15am*0.4,-eFy15am*0.3,+eFy15am*0.3,+eFy15am*0.4,+eFy15am*0.5, +eFy15am*0.6, +eFy15am*0.7]
-cf1 = ax2.contour(z, th*r[k], eFy15, cl1, cmap='bwr', linestyles='dashed', linewidths=0.5) # , extend='both')
-cl2 = np.linspace(-uZy15am, +uZy15am, ncl) # set contour levels manually
-cf2 = ax2.contourf(z, th*r[k], uZy15, cl2,  cmap=comap)
-#ax2.set_aspect('equal') # makes axis ratio natural
-#dvr = make_axes_locatable(ax2) # devider
-#cbx = dvr.append_axes("top", size="5%", pad=0.1) # make colorbar axis
-#cb1 = plt.colorbar(cf2, cax=cbx, ticks=[-uZy15am, 0, +uZy15am], orientation='horizontal') # set colorbar scale
-#cbx.xaxis.set_ticks_position("top")
-#cb1.set_label(r"${\displaystyle\omega_z}$ ")
-
-
-
-# plot mode interactive or pdf
-if plot != 2:
- plt.tight_layout()
- plt.show()
-else:
- fig.tight_layout()
- fnam = 'efluxStreaks2DBox'+'{:08d}'.format(iLast)+'.pdf'
- plt.savefig(fnam)
- print('Written file', fnam)
-print('=============================================================================================')
-fig.clf()
+# plot 2d slices of streamwise velocity and energy flux at r[k] as graph
+def makePlot(eFy15, uZy15, r, th, z, k, iLast, plot):
+    print('-------------------------------------------------------------------------')
+    print('Plotting cross-correlation to file')
+    import matplotlib as mpl
+    if plot == 2: mpl.use('Agg') # non-interactive backend, file output only
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.axes_grid1 import make_axes_locatable
+
+
+    mpl.rcParams['text.usetex'] = True
+    mpl.rcParams['text.latex.preamble'] = [
+    r"\usepackage[utf8x]{inputenc}",
+    r"\usepackage[T1]{fontenc}",
+    r"\usepackage[detect-all]{siunitx}",
+    r'\usepackage{amsmath, amstext, amssymb}',
+    r'\usepackage{xfrac}',
+    r'\usepackage{lmodern, palatino, eulervm}']
+    mpl.rcParams['font.family'] = 'serif'
+    mpl.rcParams.update({'font.size': 9})
+
+    # create figure suitable for A4 format
+    def mm2inch(*tupl):
+     inch = 25.4
+     if isinstance(tupl[0], tuple):
+      return tuple(i/inch for i in tupl[0])
+     else:
+       return tuple(i/inch for i in tupl)
+    fig = plt.figure(num=None, figsize=mm2inch(160.0, 140.0), dpi=150)
 
+    # line colours appropriate for colour-blind
+    Vermillion    = '#D55E00'
+    Blue          = '#0072B2'
+    BluishGreen   = '#009E73'
+    Orange        = '#E69F00'
+    SkyBlue       = '#56B4E9'
+    ReddishPurple = '#CC79A7'
+    Yellow        = '#F0E442'
+    Black         = '#000000'
+    #-----------------------------------------------------------------------------------
 
+    eFy15am  = np.max(np.abs(eFy15 ))
+    uZy15am  = np.max(np.abs(uZy15 ))
 
 
+    #ncl = 50 # number of countur levels, increase to make plot smoother but larger
+    comap = 'RdGy'
+    #comap = 'PiYG'
+    # plot 
 
+
+    ax1 = plt.subplot2grid((2, 1), (0, 0), rowspan=1, colspan=1)
+    #ax1.set_xlabel(r"${\Delta z}$ in $d$")
+    ax1.set_ylabel(r"${r\Delta\theta}$ in $d$")
+    cl1 = np.linspace(-eFy15am, +eFy15am, 5) # set contour levels manually
+    #cf1 = ax1.contour(th*r[k], z, np.array(eFy15).transpose(1,0), cl1,  cmap='bwr', linestyles='dashed', linewidths=0.5) # , extend='both')
+    #cl2 = np.linspace(-uZy15am, +uZy15am, ncl) # set contour levels manually
+    #cf2 = ax1.contourf(z, th*r[k], uZy15, cl2,  cmap=comap)
+    cf2 = ax1.pcolormesh(z, th*r[k], uZy15, cmap=comap, vmin=-uZy15am, vmax=+uZy15am, shading='auto', rasterized=True) # bitmap in pdf
+    #ax1.set_aspect('equal') # makes axis ratio natural
+    dvr = make_axes_locatable(ax1) # devider
+    cbx = dvr.append_axes("bottom", size="5%", pad=0.3) # make colorbar axis
+    cb1 = plt.colorbar(cf2, cax=cbx, ticks=[-uZy15am, 0, +uZy15am], orientation='horizontal') # set colorbar scale
+    cbx.xaxis.set_ticks_position("bottom")
+
+
+    ax2 = plt.subplot2grid((2, 1), (1, 0), rowspan=1, colspan=1)
+    ax2.set_xlabel(r"${\Delta z}$ in $d$")
+    ax2.set_ylabel(r"${r\Delta\theta}$ in $d$")
+    #cl1 = np.linspace(-eFy15am, +eFy15am, 5) # set contour levels manually
+    cl1 = [-eFy15am*0.7,-eFy15am*0.6,-eFy15am*0.5,-eFy15am*0.4,-eFy15am*0.3,+eFy15am*0.3,+eFy15am*0.4,+eFy15am*0.5, +eFy15am*0.6, +eFy15am*0.7]
+    cf1 = ax2.contour(z, th*r[k], eFy15, cl1, cmap='bwr', linestyles='dashed', linewidths=0.5) # , extend='both')
+    #cl2 = np.linspace(-uZy15am, +uZy15am, ncl) # set contour levels manually
+    #cf2 = ax2.contourf(z, th*r[k], uZy15, cl2,  cmap=comap)
+    cf2 = ax2.pcolormesh(z, th*r[k], uZy15, cmap=comap, vmin=-uZy15am, vmax=+uZy15am, shading='auto', rasterized=True) # bitmap in pdf
+    #ax2.set_aspect('equal') # makes axis ratio natural
+    #dvr = make_axes_locatable(ax2) # devider
+    #cbx = dvr.append_axes("top", size="5%", pad=0.1) # make colorbar axis
+    #cb1 = plt.colorbar(cf2, cax=cbx, ticks=[-uZy15am, 0, +uZy15am], orientation='horizontal') # set colorbar scale
+    #cbx.xaxis.set_ticks_position("top")
+    #cb1.set_label(r"${\displaystyle\omega_z}$ ")
+
+
+
+    # plot mode interactive or pdf
+    if plot != 2:
+     plt.tight_layout()
+     plt.show()
+    else:
+     fig.tight_layout()
+     fnam = 'efluxStreaks2DBox'+'{:08d}'.format(iLast)+'.pdf'
+     plt.savefig(fnam)
+     print('Written file', fnam)
+    print('=============================================================================================')
+    plt.close(fig) # release figure, also from pyplot's figure manager
+
+
+#=================================================================================
+# plot data as graph, (0) none, (1) interactive, (2) pdf
+# plot mode can be given as first command line argument, e.g. python efluxStreaks2DBox.py 0
+plot = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+if plot in [1, 2]: makePlot(eFy15, uZy15, r, th, z, k, iLast, plot) # skip matplotlib altogether otherwise
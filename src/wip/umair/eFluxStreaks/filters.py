@@ -4,6 +4,7 @@
 # Fourier filter:  f.fourier2d(u, rPos, lambdaTh, lambdaZ, th, z, rect)
 # Gauss   filter:  f.gauss2d  (u, lambdaTh, lambdaZ, r, th, z)
 # Box     filter:  f.box2d    box2d(u, lambdaTh, lambdaZ, r, th, z)
+#                  f.box2dMulti(u, lambdaTh, lambdaZ, r, th, z) for a stack of fields
 #-----------------------------------------------------------------------------------
 import sys
 import os.path
@@ -12,6 +13,7 @@ import math
 import numpy as np
 import multiprocessing
 from joblib import Parallel, delayed
+import scipy.fft
 #===================================================================================
 #--------------------------------FOURIER-FILTER-------------------------------------
 #===================================================================================
@@ -191,17 +193,20 @@ def box2dThZ(u, rPos, lambdaTh, lambdaZ, th, z):
 
     # set-up wavenumber vector in units of cycles per unit distance (1/R)
     kTh = np.fft.fftfreq(len(th), d=deltaTh) # homogeneous direction theta #=kX=kappaX/(2*pi)
-    kZ  = np.fft.fftfreq(len(z),  d=deltaZ)  # homogeneous direction z
+    kZ  = np.fft.rfftfreq(len(z), d=deltaZ)  # homogeneous direction z, real input -> half spectrum
 
-    # construct 2d filter kernel
+    # construct separable filter kernel, 1d in each direction
     gTh = np.sinc(kTh*np.pi*lambdaTh) # Box sinc kernel in theta direction
     gZ  = np.sinc(kZ*np.pi*lambdaZ)    # Box sinc kernel in axial direction
-    g2d = np.outer(gTh, gZ)          # 2d filter kernel in theta-z plane
 
-    # apply 2d filter kernel in Fourier space via FFT
-    uFiltered=np.fft.ifft2(np.fft.fft2(u)*g2d)
+    # apply both 1d filter kernels one after the other in Fourier space via real FFT,
+    # same as the 2d kernel outer(gTh, gZ) but without building it
+    uHat  = np.fft.rfft2(u)
+    uHat *= gTh[:, None] # broadcast over z
+    uHat *= gZ           # broadcast over theta
+    uFiltered = np.fft.irfft2(uHat, s=u.shape)
 
-    return uFiltered.real
+    return uFiltered
 
 
 #--------------------------------------------------------------------------------
@@ -233,3 +238,42 @@ def box2d(u, lambdaTh, lambdaZ, r, th, z):
 
     return uFiltered
 
+#--------------------------------------------------------------------------------
+def box2dMulti(u, lambdaTh, lambdaZ, r, th, z, workers=None):
+# 2d Box filter for a stack of 3d data sets (e.g. velocity components and
+# mixed terms) in a cylindrical co-ordinate frame work (r,th,z). Same filter
+# as box2d(), but the kernel is constructed only once for all fields and all
+# fields and wall-normal planes are filtered by one batched FFT.
+# Parameters:
+# u: stack of 3d scalar fields, shape (number of fields, nr, nth, nz)
+# lambdaTh: filter width in theta direction, arc length in unit distance
+# lambdaZ: filter width in z direction
+# r: 1d grid vector, radial (wall-normal) co-ordinate in unit length
+# th: 1d grid vector, azimuthal co-ordinate in unit radian
+# z: 1d grid vector, axial co-ordinate in unit length
+# workers: number of FFT threads, default None uses all cores
+# Returns: A stack of 3d scalar fields which are 2d-filtered in theta and z direction only
+
+    # sample spacing in each direction in unit length (pipe radii R, gap width d, etc)
+    deltaTh = (th[1] - th[0]) * r    # equidistant but r dependent, one for each plane
+    deltaZ  =  (z[1] -  z[0])        # equidistant
+
+    # set-up wavenumber vector in units of cycles per unit distance (1/R)
+    kTh = np.fft.fftfreq(len(th))[None, :] / deltaTh[:, None] # homogeneous direction theta, one row for each plane
+    kZ  = np.fft.rfftfreq(len(z), d=deltaZ)                   # homogeneous direction z, real input -> half spectrum
+
+    # construct separable 2d filter kernel
+    gTh = np.sinc(kTh*np.pi*lambdaTh) # Box sinc kernel in theta direction for each plane
+    gZ  = np.sinc(kZ*np.pi*lambdaZ)   # Box sinc kernel in axial direction
+    gTh = gTh.astype(u.dtype, copy=False) # same precision as data, no up-cast of fp32 spectra
+    gZ  =  gZ.astype(u.dtype, copy=False)
+
+    # apply 2d filter kernel in Fourier space via one batched real-to-complex FFT,
+    # scipy's pocketfft runs the batch multi-threaded on all cores
+    if workers is None: workers = multiprocessing.cpu_count()
+    uHat  = scipy.fft.rfft2(u, axes=(-2, -1), workers=workers)
+    uHat *= gTh[:, :, None] # broadcast over fields and z
+    uHat *= gZ              # broadcast over fields, r and theta
+    uFiltered = scipy.fft.irfft2(uHat, s=u.shape[-2:], axes=(-2, -1), overwrite_x=True, workers=workers)
+
+    return uFiltered